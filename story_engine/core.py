@@ -1,9 +1,14 @@
-from typing import Callable, Dict, List, Any, Optional, Tuple
+from typing import Callable, Deque, Dict, List, Any, Optional, Sequence, Tuple
+from collections import deque
 import threading
 import json
-import time
 from enum import Enum
 
+try:
+    import orjson  # быстрая C-сериализация для автосохранений
+except ImportError:
+    orjson = None
+
 # Типы стилей сообщений для UI
 class MessageType(Enum):
     INFO = "info"
@@ -69,34 +74,53 @@ class NPC:
 class StoryMap:
     def __init__(self):
         self.nodes: Dict[Tuple[str,...], Dict[str, Any]] = {}
+        self._intern: Dict[Tuple[str,...], Tuple[str,...]] = {}
+        self._tree_cache: Optional[Dict[str, Any]] = None
 
-    def register(self, path: List[str], node: Dict[str, Any]) -> None:
-        self.nodes[tuple(path)] = node
+    def register(self, path: Sequence[str], node: Dict[str, Any]) -> None:
+        key = path if isinstance(path, tuple) else tuple(path)
+        key = self._intern.setdefault(key, key)
+        if self.nodes.get(key) is not node:
+            self.nodes[key] = node
+            self._tree_cache = None
 
     def generate_map(self) -> Dict[str, Any]:
-        tree: Dict[str, Any] = {}
-        for path in self.nodes:
-            current = tree
-            for step in path:
-                current = current.setdefault(step, {})
-        return tree
+        if self._tree_cache is None:
+            tree: Dict[str, Any] = {}
+            for path in self.nodes:
+                current = tree
+                for step in path:
+                    current = current.setdefault(step, {})
+            self._tree_cache = tree
+        return self._tree_cache
 
 # Инвентарь
 class Inventory:
+    _VALID_SLOTS = frozenset({
+        "Head","Neck","Ears","Mouth","Right hand","Left hand","Back",
+        "Right leg","Left leg","Right leg bottom","Left leg bottom"
+    })
+
     def __init__(self):
-        self._items: Dict[str, List[Any]] = {slot: [] for slot in [
-            "Head","Neck","Ears","Mouth","Right hand","Left hand","Back",
-            "Right leg","Left leg","Right leg bottom","Left leg bottom"
-        ]}
+        # хранятся только занятые слоты
+        self._items: Dict[str, List[Any]] = {}
+        self._view: Dict[str, Dict[str, str]] = {}
 
     def add_item(self, slot: str, item: str, description: str, function: Callable[["Story"], None]) -> None:
+        if slot not in self._VALID_SLOTS:
+            raise KeyError(slot)
         self._items[slot] = [item, description, function]
+        self._view[slot] = {"name": item, "description": description}
 
     def remove_item(self, slot: str) -> None:
-        self._items[slot] = []
+        self._items.pop(slot, None)
+        self._view.pop(slot, None)
 
     def get_items(self) -> Dict[str, List[Any]]:
-        return {slot: data for slot, data in self._items.items() if data}
+        return self._items
+
+    def get_view(self) -> Dict[str, Dict[str, str]]:
+        return self._view
 
 # Достижения
 class Achievements:
@@ -148,7 +172,10 @@ class Story:
         self._achievements = Achievements()
         self._health = HealthSystem()
         self._log = EventLog()
-        self._messages: List[Tuple[str, Optional[str]]] = []
+        # deque: атомарные append/clear под GIL, тик-поток пишет без блокировки
+        self._messages: Deque[Tuple[str, Optional[str]]] = deque()
+        self._items_markup_cache: Optional[str] = None
+        self._achievements_markup_cache: Optional[str] = None
         self.map = StoryMap()
         self.npcs: Dict[str, NPC] = {}
         self.effects: Dict[str, Effect] = {}
@@ -156,8 +183,11 @@ class Story:
         self.tick_function = tick_function
         self.tick_interval = tick_interval
         self.auto_save = auto_save
+        self._dirty = False
         self.path: List[str] = []
-        self._stop = False
+        self._path_cache: Tuple[str, ...] = ()
+        self._node_cache: Dict[str, Any] = self._database
+        self._stop_event = threading.Event()
         self._tick_thread: Optional[threading.Thread] = None
 
         if tick_function:
@@ -165,32 +195,37 @@ class Story:
             self._tick_thread.start()
 
     def _run_tick(self) -> None:
-        while not self._stop:
+        while not self._stop_event.is_set():
             if self.tick_function:
                 self.tick_function(self)
             self._update_effects()
-            if self.auto_save:
+            if self.auto_save and self._dirty:
                 self.save_state(self.auto_save)
-            time.sleep(self.tick_interval)
+                self._dirty = False
+            self._stop_event.wait(self.tick_interval)
 
     def _update_effects(self) -> None:
-        expired = []
-        for name, effect in list(self.effects.items()):
+        remaining: Dict[str, Effect] = {}
+        expired: List[Effect] = []
+        for name, effect in self.effects.items():
             effect.duration -= 1
-            if effect.duration <= 0:
-                if effect.expire:
-                    effect.expire(self)
-                expired.append(name)
-        for name in expired:
-            del self.effects[name]
+            if effect.duration > 0:
+                remaining[name] = effect
+            elif effect.expire:
+                expired.append(effect)
+        self.effects = remaining
+        # expire-колбэки могут менять self.effects, поэтому вызываются после обхода
+        for effect in expired:
+            effect.expire(self)
 
     def stop(self) -> None:
-        self._stop = True
+        self._stop_event.set()
         if self._tick_thread:
             self._tick_thread.join()
 
     def jump_to(self, new_path: List[str]) -> None:
         self.path = new_path.copy()
+        self._dirty = True
 
     def step(self, answer: Optional[str] = None) -> Dict[str, Any]:
         node = self._get_node()
@@ -208,29 +243,59 @@ class Story:
             next_path = choice_data.get("next_path")
             if next_path is not None:
                 self.path = next_path.copy()
+                self._dirty = True
         return self._get_node()
 
     def _get_node(self) -> Dict[str, Any]:
-        node = self._database
+        # Обход возобновляется с закэшированного узла, если новый путь
+        # продолжает предыдущий (типичный шаг добавляет пару элементов).
+        current = tuple(self.path)
+        if current == self._path_cache:
+            return self._node_cache
+        common = 0
+        limit = min(len(self._path_cache), len(current))
+        while common < limit and self._path_cache[common] == current[common]:
+            common += 1
+        if common == len(self._path_cache):
+            node = self._node_cache
+            tail = current[common:]
+        else:
+            node = self._database
+            tail = current
         try:
-            for step in self.path:
+            for step in tail:
                 node = node[step]
-            self.map.register(self.path.copy(), node)
-            return node
         except KeyError:
             return {}
+        self._path_cache = current
+        self._node_cache = node
+        self.map.register(current, node)
+        return node
 
     def add_item(self, slot: str, item: str, description: str, function: Callable[["Story"], None]) -> None:
         self._inventory.add_item(slot, item, description, function)
+        self._items_markup_cache = None
+        self._dirty = True
 
     def remove_item(self, slot: str) -> None:
         self._inventory.remove_item(slot)
+        self._items_markup_cache = None
+        self._dirty = True
 
     def get_items(self) -> Dict[str, Dict[str, str]]:
-        return {slot: {"name": data[0], "description": data[1]} for slot, data in self._inventory.get_items().items()}
+        return self._inventory.get_view()
+
+    def get_items_markup(self) -> str:
+        if self._items_markup_cache is None:
+            self._items_markup_cache = "\n".join(
+                f"[b]{slot}[/b]: {data['name']} - {data['description']}"
+                for slot, data in self._inventory.get_view().items()
+            )
+        return self._items_markup_cache
 
     def set_flag(self, key: str, value: bool) -> None:
         self._flags[key] = value
+        self._dirty = True
 
     def get_flag(self, key: str) -> bool:
         return self._flags.get(key, False)
@@ -240,23 +305,34 @@ class Story:
 
     def modify_hp(self, amount: int) -> None:
         self._health.modify_hp(amount)
+        self._dirty = True
 
     def get_hp(self) -> int:
         return self._health.get_hp()
 
     def add_achievement(self, name: str, description: str) -> None:
         self._achievements.add_achievement(name, description)
+        self._achievements_markup_cache = None
+        self._dirty = True
 
     def get_achievements(self) -> Dict[str, str]:
         return self._achievements.get_achievements()
 
+    def get_achievements_markup(self) -> str:
+        if self._achievements_markup_cache is None:
+            self._achievements_markup_cache = "\n".join(
+                f"[b]{name}[/b]: {description}"
+                for name, description in self._achievements.get_achievements().items()
+            )
+        return self._achievements_markup_cache
+
     def print(self, message: str, style: Optional[str] = None) -> None:
         self._messages.append((message, style))
 
     def clear_messages(self) -> None:
         self._messages.clear()
 
-    def get_messages(self) -> List[Tuple[str, Optional[str]]]:
+    def get_messages(self) -> Deque[Tuple[str, Optional[str]]]:
         return self._messages
 
     @property
@@ -266,6 +342,7 @@ class Story:
     def apply_effect(self, effect: Effect) -> None:
         self.effects[effect.name] = effect
         effect.apply(self)
+        self._dirty = True
 
     def register_npc(self, npc: NPC) -> None:
         self.npcs[npc.name] = npc
@@ -283,12 +360,17 @@ class Story:
             "flags": self._flags,
             "path": self.path
         }
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(state, f, ensure_ascii=False, indent=2)
+        if orjson is not None:
+            with open(filename, "wb") as f:
+                f.write(orjson.dumps(state, option=orjson.OPT_INDENT_2))
+        else:
+            with open(filename, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
 
     def load_state(self, filename: str) -> None:
-        with open(filename, "r", encoding="utf-8") as f:
-            state = json.load(f)
+        with open(filename, "rb") as f:
+            raw = f.read()
+        state = orjson.loads(raw) if orjson is not None else json.loads(raw.decode("utf-8"))
         self._health = HealthSystem(state.get("hp", 0))
         self._achievements = Achievements()
         for ach, desc in state.get("achievements", {}).items():
@@ -298,3 +380,5 @@ class Story:
             self._inventory.add_item(slot, data[0], data[1], lambda s: None)
         self._flags = state.get("flags", {})
         self.path = state.get("path", [])
+        self._items_markup_cache = None
+        self._achievements_markup_cache = None